@@ -2,46 +2,56 @@
 Small Flask app that serves a single image and supports toggling a degraded state.
 
 Usage:
-  python main.py --image /path/to/image.png --host 0.0.0.0 --port 8080
+  IMAGE_PATH=/path/to/image.png gunicorn --worker-class gevent -w 1 -b :80 main:app
+  IMAGE_PATH=/path/to/image.png python main.py  # Werkzeug development server
+
+A single gevent worker lets many concurrent /get calls share one OS thread
+while keeping the degraded flag in one process.
 
 The script exposes:
   GET /        - basic status
-  GET /get     - returns the configured image (or 503 when degraded)
+  GET /get     - returns the configured image (or 503 when degraded, 304 when If-None-Match hits the ETag)
   GET/POST /degrade/on  - enable degraded mode (subsequent /get returns 503)
   GET/POST /degrade/off - disable degraded mode
 """
 
-from flask import Flask, Response, request
-import threading
+from datetime import datetime, timezone
+from flask import Flask, Response, send_file
+import hashlib
 import os
 import mimetypes
 
 app = Flask(__name__)
 
-degraded = False
-lock = threading.Lock()
+degraded = False  # a plain bool: rebinding it is atomic under the GIL, so no lock is needed
 
-IMAGE_BYTES = None
+IMAGE_PATH = None
 IMAGE_MIMETYPE = "application/octet-stream"
+IMAGE_ETAG = None
+IMAGE_MTIME = None
 
 
 @app.route("/get")
 def cat():
     """Return the configured image or an Internal Server Error when degraded is on."""
-    with lock:
-        if degraded:
-            return Response("Internal error in backend", status=503)
+    if degraded:
+        return Response("Internal error in backend", status=503)
 
     print("Returning image from /get")
-    return Response(IMAGE_BYTES, mimetype=IMAGE_MIMETYPE, status=200)
+    return send_file(
+        IMAGE_PATH,  # a path lets the WSGI server use wsgi.file_wrapper / sendfile(2)
+        mimetype=IMAGE_MIMETYPE,
+        etag=IMAGE_ETAG,
+        last_modified=IMAGE_MTIME,
+        conditional=True,  # answers If-None-Match with 304 and serves Range requests
+    )
 
 
 @app.route("/degrade/on", methods=["GET", "POST"])
 def degrade_on():
     """Turn degradation ON."""
     global degraded
-    with lock:
-        degraded = True
+    degraded = True
     return f"Degraded mode set to: {degraded}\n", 200
 
 
@@ -49,8 +59,7 @@ def degrade_on():
 def degrade_off():
     """Turn degradation OFF."""
     global degraded
-    with lock:
-        degraded = False
+    degraded = False
     print("Degraded mode OFF")
     return f"Degraded mode set to: {degraded}\n", 200
 
@@ -61,24 +70,31 @@ def index():
 
 
 def load_image(path: str):
-    """Load image bytes and set mimetype based on file extension."""
-    global IMAGE_BYTES, IMAGE_MIMETYPE
+    """Hash image bytes into an ETag, record their mtime, and set mimetype based on file extension.
+
+    The bytes themselves are never held in memory: /get streams the file from disk.
+    """
+    global IMAGE_PATH, IMAGE_MIMETYPE, IMAGE_ETAG, IMAGE_MTIME
     if not os.path.isfile(path):
         raise FileNotFoundError(path)
-    with open(path, "rb") as f:
-        IMAGE_BYTES = f.read()
+    IMAGE_PATH = os.path.abspath(path)
+    with open(IMAGE_PATH, "rb") as f:
+        IMAGE_ETAG = hashlib.file_digest(f, "sha256").hexdigest()[:16]
+    IMAGE_MTIME = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
     mtype, _ = mimetypes.guess_type(path)
     if mtype:
         IMAGE_MIMETYPE = mtype
 
 
-if __name__ == "__main__":
-    image = os.environ.get("IMAGE_PATH")
-    try:
-        load_image(image)
-        print(f"Loaded image: {image } (mimetype={IMAGE_MIMETYPE})")
-    except Exception as e:
-        print(f"Failed to load image '{image }': {e}")
-        raise
+# Loaded at import time so that a WSGI server importing ``main:app`` gets the image too.
+image = os.environ.get("IMAGE_PATH")
+try:
+    load_image(image)
+    print(f"Loaded image: {image } (mimetype={IMAGE_MIMETYPE})")
+except Exception as e:
+    print(f"Failed to load image '{image }': {e}")
+    raise
 
+
+if __name__ == "__main__":
     app.run(host=os.environ.get("HOST", "0.0.0.0"), port=int(os.environ.get("PORT", 80)))
\ No newline at end of file
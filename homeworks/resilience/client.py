@@ -1,8 +1,6 @@
 import asyncio
 from http import HTTPStatus
-import time
 from typing import Any, Literal, override
-from datetime import timedelta
 
 from resilience.strategies import (
     ResilienceStrategy,
@@ -17,7 +15,8 @@ class Client:
         self._strategy = strategy
         self._sender = sender
         self._current_attempt = 0
-        self._time_spent = timedelta(0)
+        self._budget_s = strategy.latency_budget.total_seconds()
+        self._time_spent_s = 0.0
 
     @property
     def sender(self) -> ISender:
@@ -31,40 +30,43 @@ class Client:
         return self._sender
 
     async def request(self, payload: Any) -> Literal[HTTPStatus.OK]:
-        if self._current_attempt >= self._strategy.max_retries:
-            raise ResilienceStrategyExhausted(ExhaustedReason.MAX_RETRIES_EXCEEDED)
+        loop = asyncio.get_running_loop()  # same clock as asyncio.timeout deadlines
+        while True:
+            if self._current_attempt >= self._strategy.max_retries:
+                raise ResilienceStrategyExhausted(ExhaustedReason.MAX_RETRIES_EXCEEDED)
 
-        remaining_budget = self._strategy.latency_budget - self._time_spent
-        if remaining_budget <= timedelta(0):
-            raise ResilienceStrategyExhausted(reason=ExhaustedReason.LATENCY_BUDGET_EXHAUSTED)
+            remaining_budget = self._budget_s - self._time_spent_s
+            if remaining_budget <= 0:
+                raise ResilienceStrategyExhausted(reason=ExhaustedReason.LATENCY_BUDGET_EXHAUSTED)
 
-        start_time = time.monotonic()
-        try:
-            task = self._make_request(payload)
-            result = await asyncio.wait_for(task, timeout=remaining_budget.total_seconds())
-        except asyncio.TimeoutError as error:
-            raise ResilienceStrategyExhausted(reason=ExhaustedReason.LATENCY_BUDGET_EXHAUSTED) from error
+            start_time = loop.time()
+            try:
+                async with asyncio.timeout(remaining_budget):
+                    result = await self._make_request(payload)
+            except TimeoutError as error:
+                raise ResilienceStrategyExhausted(reason=ExhaustedReason.LATENCY_BUDGET_EXHAUSTED) from error
 
-        if result in self._strategy.fast_errors:
-            raise ResilienceStrategyExhausted(reason=ExhaustedReason.NON_RETRYABLE_ERROR)
+            if result in self._strategy.fast_errors:
+                raise ResilienceStrategyExhausted(reason=ExhaustedReason.NON_RETRYABLE_ERROR)
 
-        if result == HTTPStatus.OK:
-            return result
+            if result == HTTPStatus.OK:
+                return result
 
-        end_time = time.monotonic()
-        self._time_spent += timedelta(seconds=(end_time - start_time))
-        self._current_attempt += 1
-
-        return await self.request(payload)
+            end_time = loop.time()
+            self._time_spent_s += end_time - start_time
+            self._current_attempt += 1
 
     async def _make_request(self, payload: Any) -> HTTPStatus:
         sender = self._select_sender()
-        task = sender.send(payload)
-        result = await task
-        return result
+        return await sender.send(payload)
 
 
 class BackoffClient(Client):
+    def __init__(self, strategy: ResilienceStrategy, sender: ISender) -> None:
+        super().__init__(strategy=strategy, sender=sender)
+        self._initial_delay_s = strategy.extra_strategy.initial_delay.total_seconds()
+        self._backoff_factor = strategy.extra_strategy.backoff_factor
+        self._delays: list[float] = []  # filled lazily, one entry per attempt actually reached
 
     @override
     async def _make_request(self, payload: Any) -> HTTPStatus:
@@ -74,12 +76,14 @@ class BackoffClient(Client):
         return await super()._make_request(payload)
 
     async def _execute_backoff(self) -> None:
-        initial, factor = (
-            self._strategy.extra_strategy.initial_delay,
-            self._strategy.extra_strategy.backoff_factor,
-        )
-        delay = initial.total_seconds() * (factor ** (self._current_attempt - 1))
-        await self._wait(delay)
+        await self._wait(self._backoff_delay(self._current_attempt))
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Delay before retry `attempt`, clamped to the latency budget since a longer wait could only exhaust it."""
+        while len(self._delays) < attempt:
+            delay = self._delays[-1] * self._backoff_factor if self._delays else self._initial_delay_s
+            self._delays.append(min(delay, self._budget_s))
+        return self._delays[attempt - 1]
 
     async def _wait(self, delay: float) -> None:
         await asyncio.sleep(delay)
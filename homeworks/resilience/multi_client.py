@@ -1,9 +1,8 @@
+import bisect
 from collections import deque
 from http import HTTPStatus
-import itertools
 from typing import Sequence, Any, override
 import asyncio
-from datetime import timedelta, datetime
 
 from resilience.client import Client
 from resilience.strategies import (
@@ -18,8 +17,9 @@ from resilience.sender import ISender
 
 class MultiClient(Client):
     def __init__(self, strategy: ResilienceStrategy, senders: Sequence[ISender]) -> None:
-        self._senders = senders
-        self._senders_cycle = itertools.cycle(senders)
+        self._senders = tuple(senders)
+        self._next_sender_idx = 0
+        self._others = {sender: tuple(other for other in senders if other is not sender) for sender in senders}
         super().__init__(strategy=strategy, sender=senders[0])
 
     @property
@@ -28,30 +28,94 @@ class MultiClient(Client):
 
     @override
     def _select_sender(self) -> ISender:
-        self._sender = next(self._senders_cycle)
+        self._sender = self._senders[self._next_sender_idx]
+        self._next_sender_idx = (self._next_sender_idx + 1) % len(self._senders)
         return self._sender
 
 
+class LatencyWindow:
+    """Last `size` latencies of a sender, also kept sorted so that reading a quantile is a single index."""
+
+    def __init__(self, size: int) -> None:
+        self._samples = deque[float](maxlen=size)
+        self._sorted: list[float] = []
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float) -> None:
+        if len(self._samples) == self._samples.maxlen:
+            del self._sorted[bisect.bisect_left(self._sorted, self._samples[0])]
+        self._samples.append(latency)
+        bisect.insort(self._sorted, latency)
+
+    def quantile(self, q: float) -> float:
+        return self._sorted[int(q * (len(self._sorted) - 1))]
+
+
 class HedgingMultiClient(MultiClient):
+    LATENCY_WINDOW_SIZE = 128
+    MIN_LATENCY_SAMPLES = 20
+
+    def __init__(self, strategy: ResilienceStrategy, senders: Sequence[ISender]) -> None:
+        super().__init__(strategy=strategy, senders=senders)
+        params: HedgingStrategy = strategy.extra_strategy
+        self._hedging_delay_s = params.hedging_delay.total_seconds()
+        self._latencies = {sender: LatencyWindow(self.LATENCY_WINDOW_SIZE) for sender in self._senders}
+        self._draining: set[asyncio.Future[list[Any]]] = set()
+
+    def _hedging_delay(self, sender: ISender) -> float:
+        """Configured hedging delay, raised to the sender's observed p95 latency once enough samples exist.
+
+        The learned part is capped at half of the remaining latency budget, so hedges always get a chance to run.
+        """
+        latencies = self._latencies[sender]
+        if len(latencies) < self.MIN_LATENCY_SAMPLES:
+            return self._hedging_delay_s
+        remaining_budget = self._budget_s - self._time_spent_s
+        return max(self._hedging_delay_s, min(latencies.quantile(0.95), remaining_budget / 2))
+
+    def _send(self, sender: ISender, payload: Any) -> asyncio.Task[HTTPStatus]:
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+
+        def _record_latency(task: asyncio.Task[HTTPStatus]) -> None:
+            # a losing send is cancelled at roughly hedging delay + winner latency, recording that would feed
+            # the delay back into itself until a permanently slow sender is never hedged again
+            if not task.cancelled():
+                self._latencies[sender].record(loop.time() - start_time)
+
+        task = asyncio.create_task(sender.send(payload))
+        task.add_done_callback(_record_latency)
+        return task
 
     @override
     async def _make_request(self, payload: Any) -> HTTPStatus:
-        params: HedgingStrategy = self.strategy.extra_strategy
         main_sender = self._select_sender()
-        main_task = main_sender.send(payload)
+        tasks = [self._send(main_sender, payload)]
         try:
-            result = await asyncio.wait_for(asyncio.shield(main_task), timeout=params.hedging_delay.total_seconds())
-            return result
-        except asyncio.TimeoutError:
-            other_senders = [sender for sender in self._senders if sender != main_sender]
-            tasks = [main_task] + [sender.send(payload) for sender in other_senders]
-            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-
+            try:
+                async with asyncio.timeout(self._hedging_delay(main_sender)):
+                    return await asyncio.shield(tasks[0])
+            except TimeoutError:
+                pass
+
+            tasks.extend(self._send(sender, payload) for sender in self._others[main_sender])
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            return next(iter(done)).result()
+        finally:
+            # also runs when the caller's latency budget cancels us mid-wait, which asyncio.wait does not propagate
+            pending = {task for task in tasks if not task.done()}
             for task in pending:
                 task.cancel()
+            if pending:
+                self._drain(pending)
 
-            for task in done:
-                return await task
+    def _drain(self, tasks: set[asyncio.Task[HTTPStatus]]) -> None:
+        """Collect cancelled hedges in the background, keeping a reference until they have finished."""
+        drain = asyncio.ensure_future(asyncio.gather(*tasks, return_exceptions=True))
+        self._draining.add(drain)
+        drain.add_done_callback(self._draining.discard)
 
 
 ### Circuit Breaker Related Code ###
@@ -60,8 +124,12 @@ class HedgingMultiClient(MultiClient):
 class ManagedSender:
     def __init__(self, strategy: CircuitBreakerStrategy, sender: ISender) -> None:
         self._strategy = strategy
-        self._last_results = deque[bool](maxlen=strategy.window_size)
-        self._recover_at: datetime = datetime.min
+        self._window_size = strategy.window_size
+        self._window_mask = (1 << strategy.window_size) - 1
+        self._failures_bitmap = 0  # last `window_size` results, newest in the lowest bit, 1 means failure
+        self._results_count = 0
+        self._recovery_timeout_s = strategy.recovery_timeout.total_seconds()
+        self._recover_at_mono = 0.0
         self._sender = sender
 
     @property
@@ -69,56 +137,54 @@ class ManagedSender:
         return self._sender
 
     def record_success(self) -> None:
-        self._last_results.append(True)
+        self._record(True)
 
     def record_failure(self) -> None:
-        self._last_results.append(False)
+        self._record(False)
         failure_rate = self.failure_rate
         if failure_rate >= self._strategy.failure_threshold:
-            self._recover_at = datetime.now() + self._strategy.recovery_timeout
+            self._recover_at_mono = asyncio.get_running_loop().time() + self._recovery_timeout_s
+
+    def _record(self, result: bool) -> None:
+        self._failures_bitmap = ((self._failures_bitmap << 1) | (not result)) & self._window_mask
+        if self._results_count < self._window_size:
+            self._results_count += 1
 
     @property
     def failure_rate(self) -> float:
-        if not self._last_results:
+        if not self._results_count:
             return 0.0
-        failures = sum(1 for result in self._last_results if not result)
-        return failures / len(self._last_results)
-
-    @property
-    def recovery_time(self) -> timedelta:
-        if self._recover_at is None:
-            return timedelta(0)
-        return self._recover_at - datetime.now()
+        return self._failures_bitmap.bit_count() / self._results_count
 
     @property
     def is_circuit_open(self) -> bool:
-        return datetime.now() < self._recover_at
+        return asyncio.get_running_loop().time() < self._recover_at_mono
+
+    def snapshot(self, now: float) -> tuple[bool, float, float]:
+        """Selection key at loop time `now`: closed circuit, then lower failure rate, then latest recovery."""
+        return now < self._recover_at_mono, self.failure_rate, now - self._recover_at_mono
 
 
 class CircuitBreakerMultiClient(MultiClient):
     def __init__(self, strategy: ResilienceStrategy, senders: Sequence[ISender]) -> None:
         self._managed_senders = {sender: ManagedSender(strategy.extra_strategy, sender) for sender in senders}
+        self._current_managed = self._managed_senders[senders[0]]
         super().__init__(strategy=strategy, senders=senders)
 
     @override
     def _select_sender(self) -> ISender:
-        sorted_senders = sorted(
-            self._managed_senders.values(),
-            key=lambda manager: (not manager.is_circuit_open, -manager.failure_rate, manager.recovery_time),
-        )
-        self._sender = sorted_senders[-1].sender
+        now = asyncio.get_running_loop().time()  # the clock Client measures the latency budget with
+        self._current_managed = min(self._managed_senders.values(), key=lambda manager: manager.snapshot(now))
+        self._sender = self._current_managed.sender
         return self._sender
 
     @override
     async def _make_request(self, payload: Any) -> HTTPStatus:
-        sender = self._select_sender()
-        managed_sender = self._managed_senders[sender]
+        self._select_sender()
+        managed_sender = self._current_managed
         if managed_sender.is_circuit_open:  # means that even the best possible sender is open
             raise ResilienceStrategyExhausted(ExhaustedReason.CIRCUIT_BREAKER_OPEN)
 
-        result = await super()._make_request(payload)
-        if result == HTTPStatus.OK:
-            managed_sender.record_success()
-        else:
-            managed_sender.record_failure()
+        result = await managed_sender.sender.send(payload)
+        (managed_sender.record_success if result == HTTPStatus.OK else managed_sender.record_failure)()
         return result
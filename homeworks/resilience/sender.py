@@ -1,5 +1,4 @@
 from abc import ABC, abstractmethod
-import asyncio
 from http import HTTPStatus
 from typing import Any
 
@@ -7,5 +6,5 @@ from typing import Any
 class ISender(ABC):
     
     @abstractmethod
-    def send(self, payload: Any) -> asyncio.Task[HTTPStatus]:
+    async def send(self, payload: Any) -> HTTPStatus:
         raise NotImplementedError
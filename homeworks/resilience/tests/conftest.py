@@ -1,7 +1,9 @@
 import asyncio
 from http import HTTPStatus
-from typing import Any, Callable, Iterable
-from unittest.mock import Mock, AsyncMock
+import selectors
+import sys
+from typing import Any, Awaitable, Callable, Iterable
+from unittest.mock import AsyncMock
 
 import pytest
 
@@ -10,19 +12,90 @@ from resilience.client import BackoffClient, Client
 from resilience.multi_client import HedgingMultiClient, MultiClient, CircuitBreakerMultiClient
 from resilience.strategies import BackoffStrategy, ResilienceStrategy, HedgingStrategy, CircuitBreakerStrategy
 
+if sys.platform != "win32":
+    try:
+        import uvloop
+    except ImportError:  # uvloop is optional, the default asyncio loop is used without it
+        pass
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps to the next scheduled timer instead of sleeping until it."""
+
+    def __init__(self) -> None:
+        self._virtual_time = 0.0
+        super().__init__(selector=_VirtualClockSelector(self))
+
+    def time(self) -> float:
+        return self._virtual_time
+
+
+class _VirtualClockSelector(selectors.DefaultSelector):
+    def __init__(self, loop: VirtualClockEventLoop) -> None:
+        super().__init__()
+        self._loop = loop
+
+    def select(self, timeout: float | None = None) -> list[tuple[selectors.SelectorKey, int]]:
+        if timeout is None:  # no timers are scheduled, only I/O can wake the loop up
+            return super().select(timeout)
+        events = super().select(0)
+        if not events:
+            self._loop._virtual_time += timeout
+        return events
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line("markers", "virtual_clock: run the asyncio test on a VirtualClockEventLoop")
+    # registered by pytest-xdist as well, declared here so that runs without xdist do not warn about it
+    config.addinivalue_line("markers", "xdist_group(name): keep tests on one worker under --dist=loadgroup")
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_asyncio_loop_factories(
+    config: pytest.Config,
+    item: pytest.Item,
+) -> dict[str, Callable[[], asyncio.AbstractEventLoop]]:
+    if item.get_closest_marker("virtual_clock"):
+        return {"virtual_clock": VirtualClockEventLoop}
+    return {"default": asyncio.new_event_loop}
+
 
 class TestSender(ISender):
+    __test__ = False  # a helper, not a test class, in modules that import it
+
     def __init__(self, outcome: HTTPStatus, delay: float = 0.0) -> None:
         self.outcome = outcome
         self.delay = delay
+        self.cancelled = False
 
-    async def _simulate_send(self, payload: Any) -> HTTPStatus:
-        await asyncio.sleep(self.delay)
+    async def send(self, payload: Any) -> HTTPStatus:
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
         return self.outcome
 
-    def send(self, payload: Any) -> asyncio.Task[HTTPStatus]:
-        task = asyncio.create_task(self._simulate_send(payload))
-        return task
+
+class CountingSend:
+    """Lightweight replacement for ``Mock(wraps=sender.send)`` that only records calls."""
+
+    def __init__(self, send: Callable[[Any], Awaitable[HTTPStatus]], all_calls: list[Any] | None = None) -> None:
+        self._send = send
+        self._all_calls = all_calls if all_calls is not None else []
+        self.call_count = 0
+        self.calls: list[Any] = []
+
+    def __call__(self, payload: Any) -> Awaitable[HTTPStatus]:
+        self.call_count += 1
+        self.calls.append(payload)
+        self._all_calls.append(payload)
+        return self._send(payload)
+
+    def assert_called_once(self) -> None:
+        assert self.call_count == 1, f"Expected send to have been called once. Called {self.call_count} times."
 
 
 @pytest.fixture
@@ -33,7 +106,7 @@ def create_client() -> Callable[[ResilienceStrategy, HTTPStatus, float], Client
         delay: float,
     ) -> Client:
         sender = TestSender(outcome=outcome, delay=delay)
-        sender.send = Mock(wraps=sender.send)
+        sender.send = CountingSend(sender.send)
         if isinstance(strategy.extra_strategy, BackoffStrategy):
             client = BackoffClient(strategy=strategy, sender=sender)
             client._wait = AsyncMock(wraps=client._wait)
@@ -45,7 +118,13 @@ def create_client() -> Callable[[ResilienceStrategy, HTTPStatus, float], Client
 
 
 @pytest.fixture
-def create_multi_client() -> (
+def send_calls() -> list[Any]:
+    """Payloads of every ``send`` call made by the senders of ``create_multi_client``, in call order."""
+    return []
+
+
+@pytest.fixture
+def create_multi_client(send_calls: list[Any]) -> (
     Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], MultiClient | HedgingMultiClient]
 ):
     def _create_multi_client(
@@ -56,7 +135,7 @@ def create_multi_client() -> (
         senders = []
         for outcome, delay in zip(outcomes, delays):
             sender = TestSender(outcome=outcome, delay=delay)
-            sender.send = Mock(wraps=sender.send)
+            sender.send = CountingSend(sender.send, all_calls=send_calls)
             senders.append(sender)
 
         if isinstance(strategy.extra_strategy, HedgingStrategy):
@@ -1,10 +1,10 @@
+import asyncio
 from http import HTTPStatus
-from typing import Callable, Iterable
+from typing import Any, Callable, Iterable
 import pytest
 from datetime import timedelta
 
-from resilience.sender import HTTPStatus
-from resilience.multi_client import CircuitBreakerMultiClient, HedgingMultiClient, MultiClient
+from resilience.multi_client import CircuitBreakerMultiClient, HedgingMultiClient, ManagedSender, MultiClient
 from resilience.strategies import (
     HedgingStrategy,
     ResilienceStrategy,
@@ -12,144 +12,240 @@ from resilience.strategies import (
     ExhaustedReason,
     CircuitBreakerStrategy,
 )
+from resilience.tests.conftest import TestSender
+
+_OK = HTTPStatus.OK
+_ISE = HTTPStatus.INTERNAL_SERVER_ERROR
+_SU = HTTPStatus.SERVICE_UNAVAILABLE
+_GT = HTTPStatus.GATEWAY_TIMEOUT
+_BR = HTTPStatus.BAD_REQUEST
+
+_STRAT_BASIC_1S_1R = ResilienceStrategy(latency_budget=timedelta(seconds=1), max_retries=1)
+_STRAT_BASIC_5S_3R = ResilienceStrategy(latency_budget=timedelta(seconds=5), max_retries=3, fast_errors=(_BR,))
+_STRAT_BASIC_2S_7R = ResilienceStrategy(latency_budget=timedelta(seconds=2), max_retries=7)
+_STRAT_BASIC_250MS_5R = ResilienceStrategy(latency_budget=timedelta(seconds=0.25), max_retries=5)
+_STRAT_HEDGE_1S = ResilienceStrategy(
+    latency_budget=timedelta(seconds=5),
+    max_retries=1,
+    extra_strategy=HedgingStrategy(hedging_delay=timedelta(seconds=1)),
+)
+_STRAT_HEDGE_100MS = ResilienceStrategy(
+    latency_budget=timedelta(seconds=5),
+    max_retries=1,
+    extra_strategy=HedgingStrategy(hedging_delay=timedelta(milliseconds=100)),
+)
+_STRAT_HEDGE_50MS_300MS_BUDGET = ResilienceStrategy(
+    latency_budget=timedelta(milliseconds=300),
+    max_retries=1,
+    extra_strategy=HedgingStrategy(hedging_delay=timedelta(milliseconds=50)),
+)
+_STRAT_HEDGE_100MS_500MS_BUDGET = ResilienceStrategy(
+    latency_budget=timedelta(milliseconds=500),
+    max_retries=1,
+    extra_strategy=HedgingStrategy(hedging_delay=timedelta(milliseconds=100)),
+)
+_STRAT_CB_1S_5R = ResilienceStrategy(
+    latency_budget=timedelta(seconds=1),
+    max_retries=5,
+    extra_strategy=CircuitBreakerStrategy(
+        failure_threshold=0.5,
+        recovery_timeout=timedelta(seconds=1),
+        window_size=4,
+    ),
+)
+_STRAT_CB_5S_3R = ResilienceStrategy(
+    latency_budget=timedelta(seconds=5),
+    max_retries=3,
+    extra_strategy=CircuitBreakerStrategy(
+        failure_threshold=0.5,
+        recovery_timeout=timedelta(seconds=2),
+        window_size=4,
+    ),
+)
 
 
 @pytest.mark.asyncio
+@pytest.mark.virtual_clock
 class TestBasicMultiClientCapabilities:
     async def test_client_should_succeed_on_first_attempt(
         self,
         create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], MultiClient],
     ) -> None:
-        strategy = ResilienceStrategy(latency_budget=timedelta(seconds=1), max_retries=1)
-        outcomes = [HTTPStatus.OK]
+        strategy = _STRAT_BASIC_1S_1R
+        outcomes = [_OK]
         delays = [0.1]
         client = create_multi_client(strategy, outcomes, delays)
 
         result = await client.request(payload={})
 
-        assert result == HTTPStatus.OK
+        assert result == _OK
         client.sender.send.assert_called_once()
 
     async def test_client_should_rotate_senders_on_retries(
         self,
         create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], MultiClient],
     ) -> None:
-        strategy = ResilienceStrategy(
-            latency_budget=timedelta(seconds=5), max_retries=3, fast_errors=(HTTPStatus.BAD_REQUEST,)
-        )
-        outcomes = [HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.OK]
+        strategy = _STRAT_BASIC_5S_3R
+        outcomes = [_ISE, _SU, _OK]
         delays = [0.1, 0.1, 0.1]
         client = create_multi_client(strategy, outcomes, delays)
 
         result = await client.request(payload={})
 
-        assert result == HTTPStatus.OK
+        assert result == _OK
         for sender in client.senders:
             sender.send.assert_called_once()
 
-    async def test_client_should_exhaust_strategy_after_max_retries(
-        self,
-        create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], MultiClient],
-    ) -> None:
-        strategy = ResilienceStrategy(latency_budget=timedelta(seconds=2), max_retries=7)
-        outcomes = [
-            HTTPStatus.INTERNAL_SERVER_ERROR,
-            HTTPStatus.INTERNAL_SERVER_ERROR,
-            HTTPStatus.INTERNAL_SERVER_ERROR,
-        ]
-        delays = [0.1, 0.1, 0.1]
-        client = create_multi_client(strategy, outcomes, delays)
-
-        with pytest.raises(ResilienceStrategyExhausted) as exc_info:
-            await client.request(payload={})
-
-        assert exc_info.value.reason == ExhaustedReason.MAX_RETRIES_EXCEEDED
-        total_calls = sum(sender.send.call_count for sender in client.senders)
-        assert total_calls == strategy.max_retries
-
-    async def test_client_should_exhaust_strategy_on_latency_budget(
+    @pytest.mark.parametrize(
+        "strategy, outcomes, delays, expected_reason, calls_predicate, senders_cancelled",
+        [
+            pytest.param(
+                _STRAT_BASIC_2S_7R,
+                [_ISE, _ISE, _ISE],
+                [0.1, 0.1, 0.1],
+                ExhaustedReason.MAX_RETRIES_EXCEEDED,
+                lambda total_calls, client: total_calls == client.strategy.max_retries,
+                False,
+                id="max_retries",
+            ),
+            pytest.param(
+                _STRAT_BASIC_250MS_5R,
+                [_SU, _SU, _SU],
+                [0.1, 0.1, 0.1],
+                ExhaustedReason.LATENCY_BUDGET_EXHAUSTED,
+                lambda total_calls, client: total_calls <= client.strategy.max_retries,
+                False,
+                id="latency_budget",
+            ),
+            pytest.param(
+                _STRAT_HEDGE_50MS_300MS_BUDGET,
+                [_GT, _GT, _GT],
+                [0.5, 0.5, 0.5],
+                ExhaustedReason.LATENCY_BUDGET_EXHAUSTED,
+                lambda total_calls, client: total_calls == len(client.senders),
+                True,
+                id="hedging",
+            ),
+        ],
+    )
+    async def test_client_should_exhaust_strategy(
         self,
         create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], MultiClient],
+        strategy: ResilienceStrategy,
+        outcomes: list[HTTPStatus],
+        delays: list[float],
+        expected_reason: ExhaustedReason,
+        calls_predicate: Callable[[int, MultiClient], bool],
+        senders_cancelled: bool,
+        send_calls: list[Any],
     ) -> None:
-        strategy = ResilienceStrategy(latency_budget=timedelta(seconds=0.25), max_retries=5)
-        outcomes = [HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.SERVICE_UNAVAILABLE]
-        delays = [0.1, 0.1, 0.1]
         client = create_multi_client(strategy, outcomes, delays)
 
         with pytest.raises(ResilienceStrategyExhausted) as exc_info:
             await client.request(payload={})
+        await asyncio.sleep(0)  # let the cancelled senders observe their cancellation
 
-        assert exc_info.value.reason == ExhaustedReason.LATENCY_BUDGET_EXHAUSTED
-        total_calls = sum(sender.send.call_count for sender in client.senders)
-        assert total_calls <= strategy.max_retries
+        assert exc_info.value.reason == expected_reason
+        assert calls_predicate(len(send_calls), client)
+        if senders_cancelled:
+            assert all(sender.cancelled for sender in client.senders)
 
 
 @pytest.mark.asyncio
+@pytest.mark.xdist_group(name="hedging_multi_client")
 class TestHedgingMultiClientCapabilities:
     async def test_client_should_not_hedge_requests_when_hedging_delay_has_not_been_exceeded(
         self,
         create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], HedgingMultiClient],
+        send_calls: list[Any],
     ) -> None:
-        strategy = ResilienceStrategy(
-            latency_budget=timedelta(seconds=5),
-            max_retries=1,
-            extra_strategy=HedgingStrategy(hedging_delay=timedelta(seconds=1)),
-        )
-        outcomes = [HTTPStatus.OK, HTTPStatus.OK, HTTPStatus.OK]
+        strategy = _STRAT_HEDGE_1S
+        outcomes = [_OK, _OK, _OK]
         delays = [0.1, 0.1, 0.1]
         client = create_multi_client(strategy, outcomes, delays)
 
         result = await client.request(payload={})
 
-        assert result == HTTPStatus.OK
-        total_calls = sum(sender.send.call_count for sender in client.senders)
-        assert total_calls == 1
+        assert result == _OK
+        assert len(send_calls) == 1
 
     async def test_client_should_hedge_requests(
         self,
         create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], HedgingMultiClient],
     ) -> None:
-        strategy = ResilienceStrategy(
-            latency_budget=timedelta(seconds=5),
-            max_retries=1,
-            extra_strategy=HedgingStrategy(hedging_delay=timedelta(milliseconds=100)),
-        )
-        outcomes = [HTTPStatus.GATEWAY_TIMEOUT, HTTPStatus.OK, HTTPStatus.OK, HTTPStatus.OK, HTTPStatus.GATEWAY_TIMEOUT]
+        strategy = _STRAT_HEDGE_100MS
+        outcomes = [_GT, _OK, _OK, _OK, _GT]
         delays = [0.5, 0.1, 0.1, 0.1, 0.5]
         client = create_multi_client(strategy, outcomes, delays)
 
         result = await client.request(payload={})
+        await asyncio.sleep(0)  # let the cancelled hedges observe their cancellation
 
-        assert result == HTTPStatus.OK
+        assert result == _OK
         for sender in client.senders:
             sender.send.assert_called_once()
+        slow_senders = [sender for sender, delay in zip(client.senders, delays) if delay == max(delays)]
+        assert all(sender.cancelled for sender in slow_senders)
 
-    async def test_client_should_exhaust_strategy_with_hedging(
+    async def test_client_should_record_latency_of_completed_sends_only(
         self,
         create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], HedgingMultiClient],
     ) -> None:
-        strategy = ResilienceStrategy(
-            latency_budget=timedelta(milliseconds=300),
-            max_retries=1,
-            extra_strategy=HedgingStrategy(hedging_delay=timedelta(milliseconds=50)),
-        )
-        outcomes = [
-            HTTPStatus.GATEWAY_TIMEOUT,
-            HTTPStatus.GATEWAY_TIMEOUT,
-            HTTPStatus.GATEWAY_TIMEOUT,
-        ]
-        delays = [0.5, 0.5, 0.5]
+        strategy = _STRAT_HEDGE_100MS
+        outcomes = [_GT, _OK, _OK]
+        delays = [0.5, 0.1, 0.2]
         client = create_multi_client(strategy, outcomes, delays)
 
-        with pytest.raises(ResilienceStrategyExhausted) as exc_info:
+        result = await client.request(payload={})
+        await asyncio.gather(*client._draining)
+
+        assert result == _OK
+        assert [len(client._latencies[sender]) for sender in client.senders] == [0, 1, 0]
+        assert client._latencies[client.senders[1]].quantile(0.0) == pytest.approx(0.1, abs=0.05)
+
+    @pytest.mark.virtual_clock
+    async def test_client_should_raise_hedging_delay_to_observed_p95_latency(
+        self,
+        create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], HedgingMultiClient],
+    ) -> None:
+        strategy = _STRAT_HEDGE_100MS
+        outcomes = [_OK, _OK]
+        delays = [0.3, 0.3]
+        client = create_multi_client(strategy, outcomes, delays)
+        for _ in range(2 * client.MIN_LATENCY_SAMPLES):  # every request hedges, only the main sender completes
             await client.request(payload={})
+        await asyncio.gather(*client._draining)
 
-        assert exc_info.value.reason == ExhaustedReason.LATENCY_BUDGET_EXHAUSTED
-        total_calls = sum(sender.send.call_count for sender in client.senders)
-        assert total_calls == len(client.senders)
+        main_sender, other_sender = client.senders
+        for sender in client.senders:
+            sender.delay = 0.25
+        other_calls = other_sender.send.call_count
+        result = await client.request(payload={})
+
+        assert result == _OK
+        assert client._hedging_delay(main_sender) == pytest.approx(0.3)
+        assert other_sender.send.call_count == other_calls
+
+    @pytest.mark.virtual_clock
+    async def test_client_should_keep_hedging_permanently_slow_sender(
+        self,
+        create_multi_client: Callable[[ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], HedgingMultiClient],
+    ) -> None:
+        strategy = _STRAT_HEDGE_100MS_500MS_BUDGET
+        outcomes = [_OK, _OK]
+        delays = [1.0, 0.05]
+        client = create_multi_client(strategy, outcomes, delays)
+
+        for _ in range(10 * client.MIN_LATENCY_SAMPLES):
+            assert await client.request(payload={}) == _OK
+        await asyncio.gather(*client._draining)
+
+        slow_sender = client.senders[0]
+        assert client._hedging_delay(slow_sender) == pytest.approx(0.1)
 
 
 @pytest.mark.asyncio
+@pytest.mark.xdist_group(name="circuit_breaker_multi_client")
 class TestMultiClientWithCircuitBreaker:
 
     async def test_circuit_breaker_allows_requests_when_under_threshold(
@@ -158,16 +254,8 @@ class TestMultiClientWithCircuitBreaker:
             [ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], CircuitBreakerMultiClient
         ],
     ) -> None:
-        strategy = ResilienceStrategy(
-            latency_budget=timedelta(seconds=1),
-            max_retries=5,
-            extra_strategy=CircuitBreakerStrategy(
-                failure_threshold=0.5,
-                recovery_timeout=timedelta(seconds=1),
-                window_size=4,
-            ),
-        )
-        outcomes = [HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.OK]
+        strategy = _STRAT_CB_1S_5R
+        outcomes = [_ISE, _ISE, _OK]
         delays = [0.1, 0.1, 0.1]
         client = create_multi_client(strategy, outcomes, delays)
 
@@ -178,7 +266,7 @@ class TestMultiClientWithCircuitBreaker:
             client._managed_senders[client.senders[1]],
             client._managed_senders[client.senders[2]],
         )
-        assert result == HTTPStatus.OK
+        assert result == _OK
         assert first.is_circuit_open and first.failure_rate == 1.0
         assert second.is_circuit_open and second.failure_rate == 1.0
         assert not third.is_circuit_open and third.failure_rate == 0.0
@@ -189,20 +277,8 @@ class TestMultiClientWithCircuitBreaker:
             [ResilienceStrategy, Iterable[HTTPStatus], Iterable[float]], CircuitBreakerMultiClient
         ],
     ) -> None:
-        strategy = ResilienceStrategy(
-            latency_budget=timedelta(seconds=5),
-            max_retries=3,
-            extra_strategy=CircuitBreakerStrategy(
-                failure_threshold=0.5,
-                recovery_timeout=timedelta(seconds=2),
-                window_size=4,
-            ),
-        )
-        outcomes = [
-            HTTPStatus.INTERNAL_SERVER_ERROR,
-            HTTPStatus.INTERNAL_SERVER_ERROR,
-            HTTPStatus.INTERNAL_SERVER_ERROR,
-        ]
+        strategy = _STRAT_CB_5S_3R
+        outcomes = [_ISE, _ISE, _ISE]
         delays = [0.1, 0.1, 0.1]
         client = create_multi_client(strategy, outcomes, delays)
 
@@ -218,3 +294,21 @@ class TestMultiClientWithCircuitBreaker:
         assert first.is_circuit_open and first.failure_rate == 1.0
         assert second.is_circuit_open and second.failure_rate == 1.0
         assert third.is_circuit_open and third.failure_rate == 1.0
+
+
+@pytest.mark.asyncio
+class TestManagedSender:
+    async def test_failure_rate_should_evict_results_older_than_window(self) -> None:
+        strategy = _STRAT_CB_1S_5R.extra_strategy
+        managed_sender = ManagedSender(strategy, TestSender(_OK))
+        window_size = strategy.window_size
+
+        rates = []
+        for _ in range(window_size + 1):
+            managed_sender.record_failure()
+            rates.append(managed_sender.failure_rate)
+        for _ in range(window_size + 1):
+            managed_sender.record_success()
+            rates.append(managed_sender.failure_rate)
+
+        assert rates == [1.0] * (window_size + 1) + [0.75, 0.5, 0.25, 0.0, 0.0]